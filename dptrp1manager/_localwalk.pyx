@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# cython: language_level=3
+
+"""Walk the local file system in C for LocalTree.
+
+Optional extension, LocalTree falls back to os.walk if it is not built.
+
+"""
+
+import os
+
+
+cdef extern from "<dirent.h>" nogil:
+    ctypedef struct DIR:
+        pass
+
+    struct dirent:
+        unsigned char d_type
+        char d_name[256]
+
+    DIR *opendir(const char *name)
+    dirent *readdir(DIR *dirp)
+    int closedir(DIR *dirp)
+    int dirfd(DIR *dirp)
+
+    enum:
+        DT_UNKNOWN
+        DT_DIR
+        DT_LNK
+
+
+cdef extern from "<fcntl.h>" nogil:
+    enum:
+        AT_SYMLINK_NOFOLLOW
+
+
+cdef extern from "<sys/stat.h>" nogil:
+    struct timespec:
+        long tv_sec
+        long tv_nsec
+
+    struct struct_stat "stat":
+        unsigned int st_mode
+        long long st_size
+        timespec st_mtim
+
+    int fstatat(int dirfd, const char *pathname, struct_stat *buf, int flags)
+    bint S_ISDIR(unsigned int mode)
+    bint S_ISLNK(unsigned int mode)
+
+
+def walk(rootpath, root, node_factory):
+    """Walk rootpath like os.walk and create the nodes.
+
+    Calls node_factory(parent, name, is_dir, size, mtime) for every folder and
+    every pdf file, parent being the node returned for the containing folder or
+    root. mtime is given in ns. Links to folders are not followed.
+
+    """
+    _walk_dir(os.fsencode(rootpath), root, None, node_factory)
+
+
+cdef _walk_dir(bytes path, parent, bytes dirname, node_factory):
+    cdef DIR *d
+    cdef dirent *ent
+    cdef struct_stat st
+    cdef unsigned char d_type
+    cdef int fd
+    cdef bytes name
+    cdef list subdirs = []
+
+    d = opendir(path)
+    if d == NULL:
+        # unreadable folders are skipped, as in os.walk
+        return
+    try:
+        if dirname is None:
+            node = parent
+        else:
+            node = node_factory(parent, os.fsdecode(dirname), True, 0, 0)
+        fd = dirfd(d)
+        while True:
+            ent = readdir(d)
+            if ent == NULL:
+                break
+            name = ent.d_name
+            if name == b"." or name == b"..":
+                continue
+            d_type = ent.d_type
+            if d_type == DT_UNKNOWN:
+                if fstatat(fd, ent.d_name, &st, AT_SYMLINK_NOFOLLOW) != 0:
+                    continue
+                if S_ISDIR(st.st_mode):
+                    d_type = DT_DIR
+                elif S_ISLNK(st.st_mode):
+                    d_type = DT_LNK
+            if d_type == DT_DIR:
+                subdirs.append(name)
+                continue
+            if len(name) <= 4 or name[-4:].lower() != b".pdf":
+                continue
+            # follow links to files, links to folders are skipped
+            if fstatat(fd, ent.d_name, &st, 0) != 0 or S_ISDIR(st.st_mode):
+                continue
+            node_factory(
+                node,
+                os.fsdecode(name),
+                False,
+                st.st_size,
+                st.st_mtim.tv_sec * 1000000000 + st.st_mtim.tv_nsec,
+            )
+    finally:
+        closedir(d)
+    for name in subdirs:
+        _walk_dir(path + b"/" + name, node, name, node_factory)
@@ -18,8 +18,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import os
 import os.path as osp
-from datetime import datetime
+from calendar import timegm
 
 
 class FileTransferHandler(object):
@@ -39,11 +40,13 @@ class FileTransferHandler(object):
         """Check if the local or remote file is newer.
 
         """
-        remote_time = self._dp_mgr.get_node(remote).modified_date
-        local_time = datetime.utcfromtimestamp(osp.getmtime(local))
+        # compare the modification times in ns
+        remote_date = self._dp_mgr.get_node(remote).modified_date
+        remote_time = timegm(remote_date.utctimetuple()) * 1000000000
+        local_time = os.stat(local).st_mtime_ns
         # print("{}: {}".format(remote, remote_time))
         # print("{}: {}".format(local, local_time))
-        dt = (remote_time - local_time).total_seconds()
+        dt = remote_time - local_time
         if dt == 0:
             # print("equal")
             return 0
@@ -281,6 +281,10 @@ class DPManager(object):
         path = self.fix_path(path)
         self._remote_tree.print_folder_contents(path)
 
+    def print_folder_summary(self, path):
+        path = self.fix_path(path)
+        self._remote_tree.print_folder_summary(path)
+
     def get_folder_contents(self, folder):
         folder = self.get_node(folder)
         return folder.children
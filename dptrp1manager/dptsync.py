@@ -123,9 +123,9 @@ class Synchronizer(FileTransferHandler):
         """The opposite of fix_path4local
 
         """
-        sppath = path.split("/", 1)
-        if len(sppath) > 1:
-            path = "{}/{}".format(self._remote_root, sppath[1])
+        _, sep, subpath = path.partition("/")
+        if sep:
+            path = "{}/{}".format(self._remote_root, subpath)
         else:
             path = self._remote_root
         return path
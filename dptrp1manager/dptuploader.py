@@ -106,7 +106,7 @@ class Uploader(FileTransferHandler):
                             )
                 if do_transfer:
                     print("Adding file {}".format(dest))
-                    with open(source, "rb") as f:
+                    with open(source, "rb", buffering=1 << 20) as f:
                         dest_dir_node = self._dp_mgr.get_node(dest_dir)
                         self._dp_mgr.dp.upload_byid(f, dest_dir_node.entry_id, dest_fn)
 
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Reductions over the flat arrays of the trees.
+
+Compiled with numba if it is installed, plain Python otherwise.
+
+"""
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+if njit is not None:
+
+    @njit(cache=True)
+    def total_size(sizes, lo, hi):
+        """Sum of sizes[lo:hi].
+
+        """
+        total = 0
+        for i in range(lo, hi):
+            total += sizes[i]
+        return total
+
+    @njit(cache=True)
+    def count_by_type(types, lo, hi, k):
+        """Number of entries of type k in types[lo:hi].
+
+        """
+        n = 0
+        for i in range(lo, hi):
+            if types[i] == k:
+                n += 1
+        return n
+
+else:
+
+    def total_size(sizes, lo, hi):
+        """Sum of sizes[lo:hi].
+
+        """
+        return sum(sizes[lo:hi])
+
+    def count_by_type(types, lo, hi, k):
+        """Number of entries of type k in types[lo:hi].
+
+        """
+        return types[lo:hi].count(k)
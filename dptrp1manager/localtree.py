@@ -1,26 +1,64 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import array
+import mmap
 import os
 import os.path as osp
-from datetime import datetime
+import struct
+import sys
+from datetime import datetime, timedelta
 
 import anytree
-from anytree.exporter import JsonExporter
-from anytree.importer import JsonImporter, DictImporter
+import orjson
+from anytree.importer import DictImporter
 
 from dptrp1manager import tools
 
+try:
+    from dptrp1manager._localwalk import walk as _fast_walk
+except ImportError:
+    # C extension not built, use os.walk
+    _fast_walk = None
+
 import time
 
+# modification times are stored as ns since the epoch (UTC)
+_EPOCH = datetime(1970, 1, 1)
+
+# lower case file extension of the documents to include in the tree
+_PDF_SUFFIX = ".pdf"
+
+# Binary format written by LocalTree.save_to_file: the magic followed by one
+# record per node in DFS pre-order. A record is parent index, type, file size,
+# modification time (ns) and name length, followed by the name. The root record
+# has no parent and stores its relpath as name.
+_FILE_MAGIC = b"DPLT\x01"
+_RECORD = struct.Struct("<IBQqH")
+_NO_PARENT = 0xFFFFFFFF
+_FOLDER = 0
+_DOCUMENT = 1
+
+
+def _ns2datetime(ns):
+    """Convert a modification time in ns to a datetime (UTC).
+
+    """
+    return _EPOCH + timedelta(microseconds=ns // 1000)
+
 
-class LocalNode(anytree.NodeMixin):
+class LocalNode(object):
     """Representation of a general node in the local file system.
 
+    File size and modification time of documents are not stored on the node
+    itself but in parallel arrays of the owning LocalTree, indexed by `_idx`.
+
     Attributes
     ----------
     parent : LocalNode
         Parent node.
+    children : list of LocalNode
+        Child nodes.
     relpath : string
         Path to the node relative to the tree root.
     name : string
@@ -31,14 +69,26 @@ class LocalNode(anytree.NodeMixin):
         `document` or `folder`
     file_size : int (default None)
         File size in bytes
-    modified_date : datetime (default None)
-        Last modified date
+    modified_date : int (default None)
+        Last modified time in ns since the epoch
 
     sync_state : string
         Used for syncing different trees.
 
     """
 
+    __slots__ = (
+        "parent",
+        "children",
+        "relpath",
+        "name",
+        "abspath",
+        "sync_state",
+        "entry_type",
+        "_idx",
+        "_tree",
+    )
+
     def __init__(
         self,
         parent,
@@ -46,19 +96,40 @@ class LocalNode(anytree.NodeMixin):
         name,
         abspath,
         entry_type,
-        file_size=None,
-        modified_date=None,
         sync_state=None,
+        tree=None,
+        idx=None,
     ):
-        super().__init__()
         self.parent = parent
+        self.children = []
         self.relpath = relpath
         self.name = name
         self.abspath = abspath
         self.entry_type = entry_type
-        self.file_size = file_size
-        self.modified_date = modified_date
         self.sync_state = sync_state
+        self._tree = tree
+        self._idx = idx
+        if parent is not None:
+            parent.children.append(self)
+
+    @property
+    def root(self):
+        node = self
+        while node.parent is not None:
+            node = node.parent
+        return node
+
+    @property
+    def file_size(self):
+        if self._idx is None:
+            return None
+        return self._tree._size_arr[self._idx]
+
+    @property
+    def modified_date(self):
+        if self._idx is None:
+            return None
+        return self._tree._mtime_arr[self._idx]
 
 
 class LocalTree(object):
@@ -71,9 +142,23 @@ class LocalTree(object):
             rootpath = osp.dirname(rootpath)
         self._rootpath = osp.abspath(osp.expanduser(rootpath))
         self._tree = tree
-        self._resolver = anytree.resolver.Resolver("name")
+        # file sizes and modification times (ns) of the documents
+        self._size_arr = array.array("q")
+        self._mtime_arr = array.array("q")
+        # all nodes by their relpath
+        self._by_relpath = {}
+        if tree is not None:
+            # the nodes index into the arrays of the tree that created them
+            owner = tree.root._tree
+            self._size_arr = owner._size_arr
+            self._mtime_arr = owner._mtime_arr
+            for node in anytree.PreOrderIter(tree.root):
+                self._by_relpath[node.relpath] = node
 
     def rebuild_tree(self):
+        self._size_arr = array.array("q")
+        self._mtime_arr = array.array("q")
+        self._by_relpath = {}
         self._tree = self._create_tree_root()
         self._create_tree()
 
@@ -87,20 +172,58 @@ class LocalTree(object):
 
     def remove_node(self, path):
         node = self.get_node_by_path(path)
-        childs = []
-        for n in node.parent.children:
-            if n.abspath == node.abspath:
-                pass
-            else:
-                childs.append(n)
-        node.parent.children = childs
+        node.parent.children.remove(node)
+        node.parent = None
+        for n in anytree.PreOrderIter(node):
+            del self._by_relpath[n.relpath]
+
+    def _new_node(
+        self,
+        parent,
+        relpath,
+        name,
+        abspath,
+        entry_type,
+        file_size=None,
+        modified_date=None,
+        sync_state=None,
+    ):
+        """Create a node and store size and modification time of documents in the
+        tree arrays.
+
+        modified_date is given in ns. Trees saved by older versions store it
+        as serialized datetime, which is converted.
+
+        """
+        idx = None
+        if entry_type == "document":
+            if isinstance(modified_date, dict):
+                modified_date = tools.object_hook(modified_date)
+            if isinstance(modified_date, datetime):
+                modified_date = (modified_date - _EPOCH) // timedelta(microseconds=1)
+                modified_date *= 1000
+            idx = len(self._size_arr)
+            self._size_arr.append(file_size)
+            self._mtime_arr.append(modified_date)
+        node = LocalNode(
+            parent=parent,
+            relpath=relpath,
+            name=name,
+            abspath=abspath,
+            entry_type=entry_type,
+            sync_state=sync_state,
+            tree=self,
+            idx=idx,
+        )
+        self._by_relpath[relpath] = node
+        return node
 
     def _create_tree_root(self):
         """Add the root tree node.
 
         """
         bn = osp.basename(self._rootpath)
-        rootnode = LocalNode(
+        rootnode = self._new_node(
             parent=None,
             name=bn,
             relpath=bn,
@@ -113,102 +236,192 @@ class LocalTree(object):
         """Create the tree by wlking through the file system.
 
         """
+        if _fast_walk is not None:
+            _fast_walk(self._rootpath, self._tree, self._add_walked_node)
+            return
         for path, dirs, files in os.walk(self._rootpath):
             if not path == self._rootpath:
                 parentpath = osp.relpath(osp.dirname(path), osp.dirname(self._rootpath))
                 parentnode = self.get_node_by_path(parentpath)
                 name = osp.basename(path)
                 relpath = osp.relpath(path, osp.dirname(self._rootpath))
-                LocalNode(
+                self._new_node(
                     parent=parentnode,
                     name=name,
                     relpath=relpath,
                     abspath=path,
                     entry_type="folder",
                 )
+            parentpath = None
             for name in files:
-                if osp.splitext(name)[1].lower() == ".pdf":
-                    parentpath = osp.relpath(path, osp.dirname(self._rootpath))
-                    parentnode = self.get_node_by_path(parentpath)
+                if len(name) > 4 and name[-4:].lower() == _PDF_SUFFIX:
+                    if parentpath is None:
+                        parentpath = osp.relpath(path, osp.dirname(self._rootpath))
+                        parentnode = self.get_node_by_path(parentpath)
                     relpath = osp.join(parentpath, name)
                     abspath = osp.join(path, name)
-                    modtime = datetime.utcfromtimestamp(osp.getmtime(abspath))
-                    fsize = osp.getsize(abspath)
-                    LocalNode(
+                    stat = os.stat(abspath)
+                    self._new_node(
                         parent=parentnode,
                         name=name,
                         relpath=relpath,
                         abspath=abspath,
                         entry_type="document",
-                        file_size=fsize,
-                        modified_date=modtime,
+                        file_size=stat.st_size,
+                        modified_date=stat.st_mtime_ns,
                     )
 
+    def _add_walked_node(self, parent, name, is_dir, size, mtime):
+        """Node factory for the C file system walker.
+
+        """
+        relpath = osp.join(parent.relpath, name)
+        abspath = osp.join(parent.abspath, name)
+        if is_dir:
+            return self._new_node(
+                parent=parent,
+                name=name,
+                relpath=relpath,
+                abspath=abspath,
+                entry_type="folder",
+            )
+        return self._new_node(
+            parent=parent,
+            name=name,
+            relpath=relpath,
+            abspath=abspath,
+            entry_type="document",
+            file_size=size,
+            modified_date=mtime,
+        )
+
     def save_to_file(self, path, start_node=None):
         path = osp.expanduser(path)
         if osp.exists(osp.dirname(path)):
-            exp = JsonExporter(indent=2, sort_keys=True, default=tools.default)
-            with open(path, "w") as f:
-                if start_node is None:
-                    exp.write(self._tree, f)
-                else:
-                    exp.write(start_node, f)
+            if start_node is None:
+                start_node = self._tree
+            with open(path, "wb", buffering=1 << 20) as f:
+                f.write(_FILE_MAGIC)
+                self._write_records(start_node, f)
         else:
             print(
                 "Error saving to disk. Dir {} not existing.".format(osp.dirname(path))
             )
 
+    def _write_records(self, start_node, fp):
+        """Write the subtree below start_node as binary records to fp.
+
+        """
+        sizes = self._size_arr
+        mtimes = self._mtime_arr
+        pack = _RECORD.pack
+        stack = [(start_node, _NO_PARENT, start_node.relpath)]
+        idx = 0
+        while stack:
+            node, parent_idx, name = stack.pop()
+            name = os.fsencode(name)
+            if node._idx is None:
+                fp.write(pack(parent_idx, _FOLDER, 0, 0, len(name)))
+            else:
+                fp.write(
+                    pack(
+                        parent_idx,
+                        _DOCUMENT,
+                        sizes[node._idx],
+                        mtimes[node._idx],
+                        len(name),
+                    )
+                )
+            fp.write(name)
+            stack.extend((n, idx, n.name) for n in reversed(node.children))
+            idx += 1
+
+    def _read_records(self, buf, offset):
+        """Create the nodes from the binary records in buf and return the root.
+
+        """
+        basepath = osp.dirname(self._rootpath)
+        unpack = _RECORD.unpack_from
+        recsize = _RECORD.size
+        nodes = []
+        end = len(buf)
+        while offset < end:
+            parent_idx, etype, size, mtime, namelen = unpack(buf, offset)
+            offset += recsize
+            name = os.fsdecode(buf[offset : offset + namelen])
+            offset += namelen
+            if parent_idx == _NO_PARENT:
+                parent = None
+                relpath = name
+                name = osp.basename(name)
+            else:
+                parent = nodes[parent_idx]
+                relpath = osp.join(parent.relpath, name)
+            if etype == _DOCUMENT:
+                node = self._new_node(
+                    parent=parent,
+                    relpath=relpath,
+                    name=name,
+                    abspath=osp.join(basepath, relpath),
+                    entry_type="document",
+                    file_size=size,
+                    modified_date=mtime,
+                )
+            else:
+                node = self._new_node(
+                    parent=parent,
+                    relpath=relpath,
+                    name=name,
+                    abspath=osp.join(basepath, relpath),
+                    entry_type="folder",
+                )
+            nodes.append(node)
+        return nodes[0]
+
     def printtree(self, foldersonly):
+        # collect the output and write it at once
+        lines = []
         for pre, _, node in anytree.render.RenderTree(self._tree):
-            if not foldersonly:
-                print("{}{}".format(pre, node.name))
-            else:
-                if node.entry_type == "folder":
-                    print("{}{}".format(pre, node.name))
+            if not foldersonly or node.entry_type == "folder":
+                lines.append(f"{pre}{node.name}\n")
+        sys.stdout.write("".join(lines))
 
     def print_folder_contents(self, path):
         foldernode = self.get_node_by_path(path)
         if foldernode is not None:
+            sizes = self._size_arr
+            mtimes = self._mtime_arr
+            lines = []
             for pre, _, node in anytree.render.RenderTree(foldernode):
                 if node.entry_type == "document":
-                    print(
-                        "{0}[{1: <7}][{2:}] {3}".format(
-                            pre,
-                            self._sizeof_fmt(node.file_size),
-                            node.modified_date,
-                            node.name,
-                        )
-                    )
+                    size = tools.sizeof_fmt(sizes[node._idx])
+                    mtime = _ns2datetime(mtimes[node._idx])
+                    lines.append(f"{pre}[{size: <7}][{mtime}] {node.name}\n")
                 else:
-                    print("{}{}".format(pre, node.name))
-
-    def _sizeof_fmt(self, num, suffix="B"):
-        for unit in ["", "k", "M", "G", "T", "P", "E", "Z"]:
-            if abs(num) < 1024.0:
-                return "{:3.1f}{}{}".format(num, unit, suffix)
-            num /= 1024.0
-        return "{:.1f}{}{}".format(num, "Y", suffix)
+                    lines.append(f"{pre}{node.name}\n")
+            sys.stdout.write("".join(lines))
 
     def get_node_by_path(self, path):
         """Get a tree node by its path.
 
         """
-        try:
-            searchpath = "/{}".format(path)
-            res = self._resolver.get(self._tree.root, searchpath)
-        except anytree.resolver.ChildResolverError:
-            res = None
-        return res
+        return self._by_relpath.get(path.lstrip("/"))
 
 
 def load_from_file(path):
     path = osp.expanduser(path)
     if osp.exists(osp.dirname(path)):
-        dict_imp = DictImporter(nodecls=LocalNode)
-        imp = JsonImporter(dictimporter=dict_imp, object_hook=tools.object_hook)
-        with open(path, "r") as f:
-            res = imp.read(f)
-        return LocalTree(osp.dirname(path), res)
+        tree = LocalTree(osp.dirname(path))
+        with open(path, "rb") as f:
+            if f.read(len(_FILE_MAGIC)) == _FILE_MAGIC:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    tree._tree = tree._read_records(buf, len(_FILE_MAGIC))
+            else:
+                # JSON written by older versions
+                f.seek(0)
+                data = orjson.loads(f.read())
+                tree._tree = DictImporter(nodecls=tree._new_node).import_(data)
+        return tree
     else:
         print("Error saving to disk. Dir {} not existing.".format(osp.dirname(path)))
 
@@ -1,10 +1,26 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from urllib.parse import quote_plus
 
+import orjson
+from requests.adapters import HTTPAdapter
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+from urllib3.util.retry import Retry
 from dptrp1.dptrp1 import DigitalPaper
 
+# number of concurrent requests when listing the folders
+LIST_WORKERS = 8
+
+
+def _folder_level(entry):
+    """Level of the entry in the folder tree, Document/<name> is level 2.
+
+    """
+    # str.count scans the path once in C, no split into components
+    return entry["entry_path"].count("/") + 1
+
 
 class MyDigitalPaper(DigitalPaper):
     """My extension of the DigitalPaper class.
@@ -13,9 +29,26 @@ class MyDigitalPaper(DigitalPaper):
 
     def __init__(self, addr=None):
         super().__init__(addr)
+        self._setup_session()
         # set the time of the dpt-rp1
         self.set_datetime()
 
+    def _setup_session(self):
+        """Configure the session shared by all requests to the device.
+
+        The session (with verify=False) is created by DigitalPaper. Keep enough
+        connections alive for the concurrent requests in list_all and retry
+        failed connection attempts. Requests are not repeated once sent, as the
+        upload body is a stream.
+
+        """
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, read=False),
+        )
+        self.session.mount("https://", adapter)
+
     # file management
 
     def download_byid(self, remote_id):
@@ -53,21 +86,21 @@ class MyDigitalPaper(DigitalPaper):
         doc_id = doc["document_id"]
         doc_url = "/documents/{doc_id}/file".format(doc_id=doc_id)
 
-        files = {"file": (quote_plus(remote_filename), fh, "rb")}
-        self._put_endpoint(doc_url, files=files)
+        # stream the file instead of building the multipart body in memory
+        encoder = MultipartEncoder(
+            fields={"file": (quote_plus(remote_filename), fh, "application/pdf")}
+        )
+        self.session.put(
+            self.base_url + doc_url,
+            data=encoder,
+            headers={"Content-Type": encoder.content_type},
+        )
 
     def new_folder_byid(self, directory_id, remote_foldername):
         info = {"folder_name": remote_foldername, "parent_folder_id": directory_id}
 
         r = self._post_endpoint("/folders2", data=info)
 
-    def _get_highest_level_folder(self, folderdict):
-        res = []
-        for fpath, fentry in folderdict.items():
-            level = len(fpath.split("/"))
-            res.append([level, fentry])
-        return sorted(res, key=lambda xx: xx[0])[0][1]
-
     def list_all(self):
         # TODO: This is not yet perfect. If folders are to large, entries might be missed.
         limit = 1000
@@ -76,29 +109,39 @@ class MyDigitalPaper(DigitalPaper):
         entrydict = self._get_contents("root", limit)
 
         if len(entrydict.keys()) >= limit:
-            folders = self._get_folders(entrydict)
-            while folders != {}:
-                cur_folder = self._get_highest_level_folder(folders)
-                # print(cur_folder["entry_path"])
-                # get new folders and append
-                new_entries = self._get_contents(cur_folder["entry_id"], limit)
-                entrydict.update(new_entries)
-                new_folders = self._get_folders(new_entries)
-                # remove folders if new entrydict length below limit, else add
-                # print(len(new_entries.keys()))
-                if len(new_entries.keys()) < limit:
-                    folders.pop(cur_folder["entry_path"])
-                    for ff in new_folders.keys():
-                        folders.pop(ff, None)
-                else:
-                    folders.update(new_folders)
-                    folders.pop(cur_folder["entry_path"])
+            # The listing of a folder was truncated, so list its subfolders
+            # separately. Subfolders are fetched concurrently, as each listing
+            # completes the subfolders of truncated listings are queued.
+            with ThreadPoolExecutor(max_workers=LIST_WORKERS) as executor:
+                pending = {}
+                for folder in self._get_folders_at_level(entrydict, 2):
+                    future = executor.submit(
+                        self._get_contents, folder["entry_id"], limit
+                    )
+                    pending[future] = folder
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        cur_folder = pending.pop(future)
+                        new_entries = future.result()
+                        entrydict.update(new_entries)
+                        if len(new_entries.keys()) >= limit:
+                            level = _folder_level(cur_folder) + 1
+                            for folder in self._get_folders_at_level(
+                                new_entries, level
+                            ):
+                                future = executor.submit(
+                                    self._get_contents, folder["entry_id"], limit
+                                )
+                                pending[future] = folder
         return list(entrydict.values())
 
     def _get_contents(self, toplevel_folder_id, limit):
-        data = self._get_endpoint(
+        response = self._get_endpoint(
             f"/documents2?entry_type=all&limit={limit}&order_type=created_date_asc&origin_folder_id={toplevel_folder_id}"
-        ).json()
+        )
+        # orjson decodes the large listings faster than requests' json()
+        data = orjson.loads(response.content)
         try:
             el = data["entry_list"]
         except KeyError:
@@ -109,12 +152,12 @@ class MyDigitalPaper(DigitalPaper):
             res[entry["entry_path"]] = entry
         return res
 
-    def _get_folders(self, entrydict):
-        res = {}
-        for entry in entrydict.values():
-            if entry["entry_type"] == "folder":
-                res[entry["entry_path"]] = entry
-        return res
+    def _get_folders_at_level(self, entrydict, n_level):
+        return [
+            e
+            for e in entrydict.values()
+            if e["entry_type"] == "folder" and _folder_level(e) == n_level
+        ]
 
     ### Configuration
 
@@ -1,24 +1,54 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+from array import array
+from bisect import bisect_left
 from datetime import datetime
+from functools import lru_cache
 import os.path as osp
+import sys
 import time
 
 import anytree
-from anytree.exporter import JsonExporter
-from anytree.importer import JsonImporter, DictImporter
+import ijson
+import orjson
+from anytree.importer import DictImporter
 
+from dptrp1manager import jit
 from dptrp1manager import tools
 
 
-class DPNode(anytree.NodeMixin):
+# is_new as listed by the DPT-RP1 and as saved by save_to_file
+_IS_NEW = {"true": True, "false": False, True: True, False: False, None: None}
+
+
+def _intern(value):
+    """Intern strings shared by many entries, None stays None.
+
+    """
+    if value is None:
+        return None
+    return sys.intern(value)
+
+
+def _toint(value):
+    """int() for the numeric fields, which the DPT-RP1 lists as strings.
+
+    """
+    if value is None or value.__class__ is int:
+        return value
+    return int(value)
+
+
+class DPNode(object):
     """Representation of a general node in the file system of the DPT-RP1.
 
     Attributes
     ----------
     parent : DPNode
         Parent node.
+    children : list of DPNode
+        Child nodes.
     entry_path : string
         Path to the entry
     entry_name : string
@@ -59,6 +89,36 @@ class DPNode(anytree.NodeMixin):
 
     """
 
+    # node data besides the dates, saved by RemoteTree.save_to_file
+    _ATTRS = (
+        "entry_path",
+        "entry_name",
+        "entry_type",
+        "entry_id",
+        "is_new",
+        "document_source",
+        "parent_folder_id",
+        "author",
+        "current_page",
+        "document_type",
+        "file_revision",
+        "file_size",
+        "mime_type",
+        "title",
+        "total_page",
+        "sync_state",
+    )
+    # plus the dates, see created_date and modified_date, the tree structure,
+    # the path below the root and the lookup tables kept on the root node
+    __slots__ = _ATTRS + (
+        "_created_date",
+        "_modified_date",
+        "parent",
+        "children",
+        "_rel_path",
+        "_index",
+    )
+
     def __init__(
         self,
         parent,
@@ -81,49 +141,169 @@ class DPNode(anytree.NodeMixin):
         total_page=None,
         sync_state=None,
     ):
-        super().__init__()
         self.parent = parent
+        self.children = []
+        if parent is not None:
+            parent.children.append(self)
         self.entry_path = entry_path
+        self._rel_path = entry_path.partition("/")[2]
         self.entry_name = entry_name
-        self.entry_type = entry_type
+        self.entry_type = _intern(entry_type)
         self.entry_id = entry_id
-        self.created_date = self.todatetime(created_date)
-        if is_new is not None:
-            self.is_new = bool(is_new)
-        else:
-            self.is_new = None
+        self._created_date = created_date
+        self.is_new = _IS_NEW[is_new]
         self.document_source = document_source
         self.parent_folder_id = parent_folder_id
-        self.author = author
-        self.document_type = document_type
+        self.author = _intern(author)
+        self.document_type = _intern(document_type)
         self.file_revision = file_revision
-        self.mime_type = mime_type
-        self.modified_date = self.todatetime(modified_date)
+        self.mime_type = _intern(mime_type)
+        self._modified_date = modified_date
         self.title = title
-        if current_page is not None:
-            self.current_page = int(current_page)
-        else:
-            self.current_page = None
-        if file_size is not None:
-            self.file_size = int(file_size)
-        else:
-            self.file_size = None
-        if total_page is not None:
-            self.total_page = int(total_page)
-        else:
-            self.total_page = None
+        self.current_page = _toint(current_page)
+        self.file_size = _toint(file_size)
+        self.total_page = _toint(total_page)
 
         self.sync_state = sync_state
+        # lookup tables of the tree, only set on the root node, see RemoteTree
+        self._index = None
 
-    def todatetime(self, datestring):
-        if datestring is not None:
-            if isinstance(datestring, datetime):
-                res = datestring
-            else:
-                res = datetime.strptime(datestring, "%Y-%m-%dT%H:%M:%SZ")
-        else:
-            res = None
-        return res
+    @property
+    def root(self):
+        node = self
+        while node.parent is not None:
+            node = node.parent
+        return node
+
+    @property
+    def is_leaf(self):
+        return not self.children
+
+    # The dates are stored as listed and only converted when read. Most nodes
+    # are never asked for them.
+
+    @property
+    def created_date(self):
+        date = self._created_date
+        if date.__class__ is str:
+            date = self._created_date = self.todatetime(date)
+        return date
+
+    @created_date.setter
+    def created_date(self, value):
+        self._created_date = value
+
+    @property
+    def modified_date(self):
+        date = self._modified_date
+        if date.__class__ is str:
+            date = self._modified_date = self.todatetime(date)
+        return date
+
+    @modified_date.setter
+    def modified_date(self, value):
+        self._modified_date = value
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def todatetime(datestring):
+        """Convert the fixed width date string YYYY-MM-DDTHH:MM:SSZ of the
+        DPT-RP1.
+
+        Cached, as many entries are created or modified at the same time.
+
+        """
+        if datestring is None:
+            return None
+        if isinstance(datestring, datetime):
+            return datestring
+        return datetime(
+            int(datestring[0:4]),
+            int(datestring[5:7]),
+            int(datestring[8:10]),
+            int(datestring[11:13]),
+            int(datestring[14:16]),
+            int(datestring[17:19]),
+        )
+
+
+def _folder_node(parent, data):
+    """Create the node of a folder entry.
+
+    """
+    return DPNode(
+        parent=parent,
+        entry_path=data["entry_path"],
+        entry_name=data["entry_name"],
+        entry_type="folder",
+        entry_id=data["entry_id"],
+        created_date=data["created_date"],
+        is_new=data["is_new"],
+        document_source=data.get("document_source", None),
+        parent_folder_id=data["parent_folder_id"],
+    )
+
+
+def _document_node(parent, data):
+    """Create the node of a document entry.
+
+    """
+    return DPNode(
+        parent=parent,
+        entry_path=data["entry_path"],
+        entry_name=data["entry_name"],
+        entry_type="document",
+        entry_id=data["entry_id"],
+        created_date=data["created_date"],
+        is_new=data["is_new"],
+        author=data.get("author", None),
+        current_page=data["current_page"],
+        document_type=data["document_type"],
+        file_revision=data["file_revision"],
+        file_size=data["file_size"],
+        mime_type=data["mime_type"],
+        modified_date=data["modified_date"],
+        title=data.get("title", None),
+        total_page=data["total_page"],
+    )
+
+
+# node constructors by entry_type
+_NODE_BUILDERS = {"folder": _folder_node, "document": _document_node}
+
+
+def _iter_nodes(root):
+    """Iterate over root and all nodes below in pre-order.
+
+    Same order as anytree.PreOrderIter, but walks an explicit stack instead of
+    recursing.
+
+    """
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node.children))
+
+
+class _TreeIndex(object):
+    """Lookup tables of a tree of DPNodes.
+
+    Kept on the root node, so that all RemoteTree objects on nodes of the same
+    tree share them and see each other's changes.
+
+    """
+
+    __slots__ = ("by_path", "by_id", "paths", "types", "sizes")
+
+    def __init__(self):
+        # nodes by entry_path and by entry_id
+        self.by_path = {}
+        self.by_id = {}
+        # all entries sorted by path with their types and sizes, built on demand
+        self.paths = None
+        self.types = None
+        self.sizes = None
 
 
 class RemoteTree(object):
@@ -133,13 +313,103 @@ class RemoteTree(object):
 
     def __init__(self, tree=None):
         self._tree = tree
-        self._resolver = anytree.resolver.Resolver("entry_name")
+        self._index = None
+        self._path_index = None
+        self._id_index = None
+        if tree is not None:
+            self._attach_index(tree.root)
+        # folder of the last created node while building, see _create_update_node
+        self._last_parent = None
+
+    def _attach_index(self, root):
+        """Use the lookup tables of the tree at root, create them if not yet there.
+
+        """
+        index = root._index
+        new_index = index is None
+        if new_index:
+            index = root._index = _TreeIndex()
+        self._index = index
+        self._path_index = index.by_path
+        self._id_index = index.by_id
+        if new_index:
+            for node in _iter_nodes(root):
+                self._index_node(node)
+
+    def _index_node(self, node):
+        """Make the node available to get_node_by_path and get_node_by_id.
+
+        """
+        self._path_index[node.entry_path] = node
+        if node.entry_id is not None:
+            self._id_index[node.entry_id] = node
+
+    def _tree_changed(self):
+        """Invalidate the flat arrays after a change of the tree.
+
+        """
+        index = self._index
+        index.paths = None
+        index.types = None
+        index.sizes = None
+
+    def _build_flat_arrays(self):
+        """Collect all entries sorted by path into parallel arrays.
+
+        The entries below a folder are then a contiguous slice.
+
+        """
+        entries = sorted(
+            (node.entry_path, node.entry_type == "document", node.file_size or 0)
+            for node in _iter_nodes(self._tree.root)
+        )
+        index = self._index
+        index.paths = [e[0] for e in entries]
+        # 0 for folders, 1 for documents
+        index.types = array("b", [e[1] for e in entries])
+        index.sizes = array("q", [e[2] for e in entries])
+
+    def folder_summary(self, path):
+        """Count the folders and documents below a folder and sum their sizes.
+
+        Returns
+        -------
+        tuple
+            (number of folders, number of documents, total size in bytes)
+
+        """
+        index = self._index
+        if index.paths is None:
+            self._build_flat_arrays()
+        # "0" is the character following "/", so hi is the end of the prefix range
+        lo = bisect_left(index.paths, path + "/")
+        hi = bisect_left(index.paths, path + "0", lo)
+        n_docs = jit.count_by_type(index.types, lo, hi, 1)
+        return hi - lo - n_docs, n_docs, jit.total_size(index.sizes, lo, hi)
 
     def rebuild_tree(self, jsondata):
+        """Build the tree from the entries listed by the DPT-RP1.
+
+        Parameters
+        ----------
+        jsondata : iterable of dict
+            The entries as decoded from the device's json, e.g. the list
+            returned by MyDigitalPaper.list_all. Each has the keys entry_path,
+            entry_name, entry_type, entry_id, created_date, is_new and
+            parent_folder_id. Documents have current_page, document_type,
+            file_revision, file_size, mime_type, modified_date and total_page in
+            addition, and optionally author and title. Numbers may be strings,
+            as listed by the device, or ints.
+
+        """
+        self._last_parent = None
+        # the new root comes with new, empty lookup tables
         self._tree = self._create_tree_root()
-        for data in jsondata:
-            self._create_path(data["entry_path"])
+        # parents come before their children, so the path needs no creation
+        for data in sorted(jsondata, key=lambda d: d["entry_path"].count("/")):
             self._create_update_node(data)
+        # other RemoteTrees on these nodes may remove the folder later
+        self._last_parent = None
         # self.save_to_file("~/.dpmgr/contents.json")
         self._save_content_list("~/.dpmgr/contents")
 
@@ -150,32 +420,54 @@ class RemoteTree(object):
     def save_to_file(self, path, start_node=None):
         path = osp.expanduser(path)
         if osp.exists(osp.dirname(path)):
-            exp = JsonExporter(indent=2, sort_keys=True, default=tools.default)
-            with open(path, "w") as f:
-                if start_node is None:
-                    exp.write(self._tree, f)
-                else:
-                    exp.write(start_node, f)
+            if start_node is None:
+                start_node = self._tree
+            records = [self._export_record(n) for n in _iter_nodes(start_node)]
+            with open(path, "wb") as f:
+                f.write(
+                    orjson.dumps(
+                        records, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS
+                    )
+                )
         else:
             print(
                 "Error saving to disk. Dir {} not existing.".format(osp.dirname(path))
             )
 
+    def _export_record(self, node):
+        """Convert the node to a flat dictionary like the entries of the DPT-RP1.
+
+        The records are read back one by one with _create_update_node. Dates not
+        yet converted are written as listed, orjson writes the converted ones as
+        YYYY-MM-DDTHH:MM:SS. DPNode.todatetime reads both.
+
+        """
+        data = {attr: getattr(node, attr) for attr in DPNode._ATTRS}
+        data["created_date"] = node._created_date
+        data["modified_date"] = node._modified_date
+        return data
+
     def _save_dir_list(self, path):
         path = osp.expanduser(path)
         if osp.exists(osp.dirname(path)):
+            lines = [
+                node._rel_path + "\n"
+                for node in _iter_nodes(self._tree)
+                if node.entry_type == "folder"
+            ]
             with open(path, "w") as f:
-                for _, _, node in anytree.render.RenderTree(self._tree):
-                    if node.entry_type == "folder":
-                        f.write("{}\n".format(node.entry_path.split("/", 1)[1]))
+                f.write("".join(lines))
 
     def _save_content_list(self, path):
         path = osp.expanduser(path)
         if osp.exists(osp.dirname(path)):
+            lines = [
+                node._rel_path + "\n"
+                for node in _iter_nodes(self._tree)
+                if node.is_leaf
+            ]
             with open(path, "w") as f:
-                for _, _, node in anytree.render.RenderTree(self._tree):
-                    if node.is_leaf:
-                        f.write("{}\n".format(node.entry_path.split("/", 1)[1]))
+                f.write("".join(lines))
 
     def _create_tree_root(self):
         """Add the root tree node.
@@ -190,32 +482,40 @@ class RemoteTree(object):
             entry_path="Document",
             is_new=False,
         )
+        self._attach_index(rootnode)
         return rootnode
 
     def remove_node(self, path):
         node = self.get_node_by_path(path)
-        childs = []
         if node is not None:
-            for n in node.parent.children:
-                if n.entry_path == node.entry_path:
-                    pass
-                else:
-                    childs.append(n)
-            node.parent.children = childs
+            self._tree_changed()
+            self._last_parent = None
+            node.parent.children.remove(node)
+            node.parent = None
+            for n in _iter_nodes(node):
+                self._path_index.pop(n.entry_path, None)
+                self._id_index.pop(n.entry_id, None)
 
     def _create_path(self, path):
         """Create the path to the node if not yet there.
 
-        We just create empty nodes, the data will be added in _create_update_node.
+        We just create empty nodes. Only needed if the parent folder of an entry
+        is not listed, listed folders always come before their entries.
+
+        Returns
+        -------
+        DPNode
+            The parent folder of the entry at path.
 
         """
         splpath = path.split("/")
-        lastpath = "{}".format(splpath[0])
+        curpath = splpath[0]
+        parent = self._path_index[curpath]
         for d in splpath[1:-1]:
-            curpath = "{}/{}".format(lastpath, d)
-            if self.get_node_by_path(curpath) is None:
-                parent = self.get_node_by_path(lastpath)
-                DPNode(
+            curpath = curpath + "/" + d
+            node = self._path_index.get(curpath)
+            if node is None:
+                node = DPNode(
                     parent=parent,
                     entry_path=curpath,
                     entry_name=d,
@@ -226,55 +526,29 @@ class RemoteTree(object):
                     document_source=None,
                     parent_folder_id=None,
                 )
-            lastpath = curpath
+                self._path_index[curpath] = node
+            parent = node
+        return parent
 
     def _create_update_node(self, data):
-        """Create or update the node given in data.
+        """Create the node given in data.
+
+        The parent folder has to be added first, see rebuild_tree.
 
         """
+        self._tree_changed()
         parentpath = data["entry_path"].rsplit("/", 1)[0]
-        parent = self.get_node_by_path(parentpath)
-        if data["entry_type"] == "folder":
-            node = self.get_node_by_path(data["entry_path"])
-            if node is None:
-                DPNode(
-                    parent=parent,
-                    entry_path=data["entry_path"],
-                    entry_name=data["entry_name"],
-                    entry_type=data["entry_type"],
-                    entry_id=data["entry_id"],
-                    created_date=data["created_date"],
-                    is_new=data["is_new"],
-                    document_source=data.get("document_source", None),
-                    parent_folder_id=data["parent_folder_id"],
-                )
-            else:
-                # add node data
-                node.entry_type = data["entry_type"]
-                node.entry_id = data["entry_id"]
-                node.created_date = node.todatetime(data["created_date"])
-                node.is_new = bool(data["is_new"])
-                node.document_source = data.get("document_source", None)
-                node.parent_folder_id = data["parent_folder_id"]
-        elif data["entry_type"] == "document":
-            DPNode(
-                parent=parent,
-                entry_path=data["entry_path"],
-                entry_name=data["entry_name"],
-                entry_type=data["entry_type"],
-                entry_id=data["entry_id"],
-                created_date=data["created_date"],
-                is_new=data["is_new"],
-                author=data.get("author", None),
-                current_page=data["current_page"],
-                document_type=data["document_type"],
-                file_revision=data["file_revision"],
-                file_size=data["file_size"],
-                mime_type=data["mime_type"],
-                modified_date=data["modified_date"],
-                title=data.get("title", None),
-                total_page=data["total_page"],
-            )
+        # the entries of a folder are listed together, mostly the last parent fits
+        parent = self._last_parent
+        if parent is None or parent.entry_path != parentpath:
+            parent = self.get_node_by_path(parentpath)
+            if parent is None:
+                parent = self._create_path(data["entry_path"])
+            self._last_parent = parent
+        build = _NODE_BUILDERS.get(data["entry_type"])
+        # no type for the empty folders of _create_path in saved trees
+        if build is not None:
+            self._index_node(build(parent, data))
 
     def printtree(self, path, foldersonly):
         foldernode = self.get_node_by_path(path)
@@ -296,7 +570,7 @@ class RemoteTree(object):
                     print(
                         "{0}[{1: <7}][{2:}] {3}".format(
                             pre,
-                            self._sizeof_fmt(node.file_size),
+                            tools.sizeof_fmt(node.file_size),
                             node.modified_date,
                             node.entry_name,
                         )
@@ -306,50 +580,85 @@ class RemoteTree(object):
         else:
             print("ERROR: Folder {} not found.".format(path))
 
-    def _sizeof_fmt(self, num, suffix="B"):
-        for unit in ["", "k", "M", "G", "T", "P", "E", "Z"]:
-            if abs(num) < 1024.0:
-                return "{:3.1f}{}{}".format(num, unit, suffix)
-            num /= 1024.0
-        return "{:.1f}{}{}".format(num, "Y", suffix)
+    def print_folder_summary(self, path):
+        foldernode = self.get_node_by_path(path)
+        if foldernode is not None:
+            n_folders, n_docs, size = self.folder_summary(foldernode.entry_path)
+            print(
+                "{} folders, {} documents, {}".format(
+                    n_folders, n_docs, tools.sizeof_fmt(size)
+                )
+            )
+        else:
+            print("ERROR: Folder {} not found.".format(path))
 
     def get_node_by_path(self, path):
         """Get a tree node by its path.
 
         """
-        try:
-            searchpath = "/{}".format(path)
-            res = self._resolver.get(self._tree.root, searchpath)
-        except (anytree.resolver.ChildResolverError, anytree.resolver.ResolverError):
-            res = None
-        return res
+        node = self._path_index.get(path)
+        if node is None and ("//" in path or path[:1] == "/" or path[-1:] == "/"):
+            # drop empty components, DPManager.fix_path makes Document/ of / and
+            # Document//A of /A
+            node = self._path_index.get("/".join(p for p in path.split("/") if p))
+        return node
+
+    def get_node_by_id(self, entry_id):
+        """Get a tree node by its entry_id.
+
+        """
+        return self._id_index.get(entry_id)
 
     def insert_folder_node(self, data):
         """Insert a folder into the tree.
 
         """
-        parentpath = data["entry_path"].rsplit("/", 1)[0]
-        parent = self.get_node_by_path(parentpath)
-        DPNode(
-            parent=parent,
-            entry_path=data["entry_path"],
-            entry_name=data["entry_name"],
-            entry_type="folder",
-            entry_id=data["entry_id"],
-            created_date=data["created_date"],
-            is_new=data["is_new"],
-            document_source=data.get("document_source", None),
-            parent_folder_id=data["parent_folder_id"],
-        )
+        self._tree_changed()
+        parent = self.get_node_by_id(data["parent_folder_id"])
+        if parent is None:
+            # the root node does not carry the device's id of the top level folder
+            parent = self.get_node_by_path(data["entry_path"].rsplit("/", 1)[0])
+        self._index_node(_folder_node(parent, data))
+
+
+def _revive_dates(data):
+    """Convert the dates of nested node dictionaries written by tools.default.
+
+    """
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        for attr in ("created_date", "modified_date"):
+            value = node.get(attr)
+            if isinstance(value, dict):
+                node[attr] = tools.object_hook(value)
+        stack.extend(node.get("children", ()))
 
 
 def load_from_file(path):
     path = osp.expanduser(path)
     if osp.exists(osp.dirname(path)):
-        dict_imp = DictImporter(nodecls=DPNode)
-        imp = JsonImporter(dictimporter=dict_imp, object_hook=tools.object_hook)
-        with open(path, "r") as f:
-            res = imp.read(f)
-        return RemoteTree(res)
+        with open(path, "rb") as f:
+            # older versions saved the nested dictionaries of anytree
+            legacy = f.read(64).lstrip().startswith(b"{")
+            f.seek(0)
+            if legacy:
+                data = orjson.loads(f.read())
+                _revive_dates(data)
+                return RemoteTree(DictImporter(nodecls=DPNode).import_(data))
+            tree = RemoteTree()
+            tree._tree = tree._create_tree_root()
+            root = tree._tree
+            start_path = None
+            # the records are parsed one at a time, parents before their children
+            for data in ijson.items(f, "item"):
+                if start_path is None:
+                    start_path = data["entry_path"]
+                if data["entry_path"] != root.entry_path:
+                    tree._create_update_node(data)
+        tree._last_parent = None
+        if start_path is not None:
+            tree._tree = tree.get_node_by_path(start_path) or root
+        return tree
     else:
         print("Error saving to disk. Dir {} not existing.".format(osp.dirname(path)))
@@ -18,15 +18,37 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from functools import lru_cache
 from subprocess import check_output
 import sys
+import time
 from datetime import datetime
 
+# unit prefixes used by sizeof_fmt, one per factor of 1024
+_SIZE_UNITS = ("", "k", "M", "G", "T", "P", "E", "Z", "Y")
+
+# seconds for which the output of iw is reused
+_IW_TTL = 5
+
+
+@lru_cache(maxsize=8)
+def _iw_cached(args, timeslot):
+    return check_output(("iw",) + args).decode()
+
+
+def _iw(*args):
+    """Run iw with the given arguments.
+
+    The output is reused for calls within the same _IW_TTL seconds time slot.
+
+    """
+    return _iw_cached(args, int(time.monotonic() // _IW_TTL))
+
 
 def check_link(devs):
     if sys.platform == "linux" or sys.platform == "linux2":
         for dev, val in devs.items():
-            scanoutput = check_output(["iw", "dev", dev, "link"]).decode()
+            scanoutput = _iw("dev", dev, "link")
             lines = scanoutput.split("\n")
             for nn, line in enumerate(lines):
                 line = line.strip()
@@ -45,7 +67,7 @@ def get_ssids():
 
     """
     if sys.platform == "linux" or sys.platform == "linux2":
-        scanoutput = check_output(["iw", "dev"]).decode()
+        scanoutput = _iw("dev")
         lines = scanoutput.split("\n")
         devs = {}
         lastdev = ""
@@ -69,6 +91,16 @@ def get_ssids():
         return None
 
 
+def sizeof_fmt(num, suffix="B"):
+    """Format a size in bytes in human readable form, e.g. 3.0MB.
+
+    """
+    # the unit follows directly from the number of bits of the size
+    n = abs(int(num))
+    idx = min((n.bit_length() - 1) // 10, 8) if n else 0
+    return "{:3.1f}{}{}".format(num / (1 << (idx * 10)), _SIZE_UNITS[idx], suffix)
+
+
 def default(obj):
     """For json serialization of a datetime object.
 
@@ -77,7 +109,9 @@ def default(obj):
     """
     if isinstance(obj, datetime):
         return {"_isoformat": obj.isoformat()}
-    return super().default(obj)
+    raise TypeError(
+        "Object of type {} is not JSON serializable".format(type(obj).__name__)
+    )
 
 
 def object_hook(obj):
@@ -86,9 +120,9 @@ def object_hook(obj):
     Use as json.loads(object_hook=object_hook)
 
     """
-    _isoformat = obj.get("_isoformat")
-    if _isoformat is not None:
-        return datetime.fromisoformat(_isoformat)
+    # default writes the date as the only key, other objects skip the lookup
+    if len(obj) == 1 and "_isoformat" in obj:
+        return datetime.fromisoformat(obj["_isoformat"])
     return obj
 
 
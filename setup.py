@@ -7,6 +7,11 @@ import json
 import setuptools
 from setuptools.command.test import test as TestCommand
 
+try:
+    from Cython.Build import cythonize
+except ImportError:
+    cythonize = None
+
 DIRECTORY = os.path.dirname(os.path.realpath(__file__))
 SETUP_JSON = None
 
@@ -20,6 +25,21 @@ except Exception as e:
     sys.exit(1)
 
 
+def extensions():
+    """The optional C file system walker, only built if Cython is available.
+
+    """
+    if cythonize is None:
+        return []
+    ext = setuptools.Extension(
+        "dptrp1manager._localwalk",
+        [os.path.join("dptrp1manager", "_localwalk.pyx")],
+        extra_compile_args=["-O3"],
+        optional=True,
+    )
+    return cythonize([ext], language_level=3)
+
+
 def readme():
     with open(os.path.join(DIRECTORY, 'README.md')) as f:
         return f.read()
@@ -51,6 +71,7 @@ setuptools.setup(
     url=None,
     namespace_packages=SETUP_JSON['namespace_packages'],
     packages=SETUP_JSON['packages'],
+    ext_modules=extensions(),
     install_requires=SETUP_JSON['install_requires'],
     tests_require=['pytest'],
     cmdclass={'test': PyTest},